@@ -9,13 +9,13 @@ N = FS * WIN_SEC
 
 df = pd.read_csv(RAW, header=None,
                  names=["user","activity","timestamp","accel_x","accel_y","accel_z"],
-                 sep=",", engine="python")
+                 sep=",", engine="c", comment=";")  # ';' terminator dropped by the C parser
 for c in ["accel_x","accel_y","accel_z"]:
-    df[c] = pd.to_numeric(df[c].astype(str).str.replace(";", "", regex=False).str.strip(), errors="coerce")
+    df[c] = pd.to_numeric(df[c], errors="coerce")
 df = df.dropna(subset=["accel_x","accel_y","accel_z"]).reset_index(drop=True)
 
 # pick a window of a specific activity from raw labels (e.g., Walking)
 win = df[df["activity"].str.strip() == "Walking"].iloc[:N]
-payload = {"samples": win[["accel_x","accel_y","accel_z"]].to_dict(orient="records")}
+payload = {"ax": win["accel_x"].tolist(), "ay": win["accel_y"].tolist(), "az": win["accel_z"].tolist()}
 r = requests.post(API_URL, json=payload, timeout=10)
 print("Walking window →", r.status_code, r.json())
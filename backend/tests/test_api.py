@@ -0,0 +1,169 @@
+import sys
+from pathlib import Path
+
+import msgpack
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app import main  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as c:
+        yield c
+
+
+def ref_calibrate(seg):
+    """NumPy calibration the kernel replaced."""
+    x = seg.astype(np.float64, copy=True)
+    z_mean = float(x[:, 2].mean())
+    abs95 = float(np.percentile(np.abs(x), 95))
+    if (7.0 <= z_mean <= 12.0) or (abs95 > 5.0):
+        mag = np.linalg.norm(x, axis=1)
+        if mag.std() < 0.25:
+            x *= np.clip(0.75 / max(mag.std(), 1e-6), 1.0, 2.0)
+        return x
+    x *= 9.81
+    if -3.0 < float(x[:, 2].mean()) < 3.0:
+        x[:, 2] += 9.0
+    mag_std = float(np.linalg.norm(x, axis=1).std())
+    if mag_std < 0.3:
+        x *= np.clip(1.0 / max(mag_std, 1e-6), 1.0, 3.0)
+    return x
+
+
+def calibrate(seg):
+    x = seg.copy()
+    main._calibrate_kernel(x, np.empty(3 * len(x)))
+    return x
+
+
+# -----------------
+# Artifacts
+# -----------------
+def test_onnx_matches_pickle():
+    assert main.SESSION is not None
+    X = np.random.default_rng(0).normal(size=(200, main.N_FEATURES)).astype(np.float32)
+    onnx = main.SESSION.run([main._ONNX_PROBA], {main._ONNX_IN: X})[0]
+    # float32 thresholds in the export: a sample sitting on a split can land in
+    # another leaf of one tree, so allow a few trees' worth of difference
+    np.testing.assert_allclose(onnx, main.MODEL.predict_proba(X), atol=0.02)
+
+
+def test_onnx_hash_mismatch(tmp_path):
+    stale = tmp_path / "model.onnx"
+    stale.write_bytes(main.ONNX_ART.read_bytes() + b"\0")
+    with pytest.warns(UserWarning, match="not exported"):
+        assert main._load_onnx(stale, main.art["onnx_sha256"]) is None
+    assert main._load_onnx(tmp_path / "missing.onnx", main.art["onnx_sha256"]) is None
+
+
+def test_forest_kernel_matches_sklearn(monkeypatch):
+    # Not built when the ONNX export is served, so force it here
+    monkeypatch.setattr(main, "SESSION", None)
+    monkeypatch.setattr(main, "FOREST", main._flatten_forest(main.MODEL))
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(500, main.N_FEATURES)).astype(np.float32)
+    # samples on split thresholds exercise the <= comparison
+    tree = main.MODEL.estimators_[0].tree_
+    split = tree.feature >= 0
+    for row, (f, t) in zip(X[:100], zip(tree.feature[split], tree.threshold[split])):
+        row[f] = t
+    np.testing.assert_allclose(main._predict_proba(X), main.MODEL.predict_proba(X), rtol=0, atol=1e-12)
+
+
+# -----------------
+# Calibration
+# -----------------
+@pytest.mark.parametrize("loc,scale", [(0.0, 0.5), (0.0, 0.01), (0.3, 0.02), (9.0, 3.0), (9.81, 0.05)])
+def test_calibrate_matches_reference(loc, scale):
+    rng = np.random.default_rng(int(loc * 100 + scale * 1000))
+    seg = rng.normal(0.0, scale, size=(main.WIN, 3))
+    seg[:, 2] += loc
+    np.testing.assert_allclose(calibrate(seg), ref_calibrate(seg), rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("bad", [np.nan, np.inf, -np.inf])
+def test_calibrate_non_finite(bad):
+    seg = np.random.default_rng(0).normal(0.0, 0.01, size=(main.WIN, 3))
+    seg[7, 1] = bad
+    with np.errstate(invalid="ignore"):
+        want = ref_calibrate(seg)
+    np.testing.assert_allclose(calibrate(seg), want, equal_nan=True)
+    assert np.isfinite(main._featurize(seg)).all()
+
+
+# -----------------
+# /predict payload validation
+# -----------------
+def axes(n=None, **override):
+    ok = [0.1] * (n or main.WIN)
+    return {"ax": ok, "ay": ok, "az": ok, **override}
+
+
+def test_predict_ok(client):
+    r = client.post("/predict", json=axes())
+    assert r.status_code == 200
+    assert r.json()["met_class"] in main.CLASSES
+
+
+@pytest.mark.parametrize("bad", [None, True, "1", [1.0]])
+def test_predict_rejects_non_numbers(client, bad):
+    body = axes()
+    body["ay"] = body["ay"][:3] + [bad] + body["ay"][4:]
+    r = client.post("/predict", json=body)
+    assert r.status_code == 422
+    (err,) = r.json()["detail"]
+    assert err["loc"] == ["body", "ay", 3]
+
+
+@pytest.mark.parametrize("body", [[1, 2], {"ax": [0.1], "ay": [0.1]}, {"ax": 1, "ay": [], "az": []}])
+def test_predict_rejects_malformed(client, body):
+    assert client.post("/predict", json=body).status_code == 422
+
+
+def test_predict_length_mismatch(client):
+    body = axes()
+    body["az"] = body["az"][:-1]
+    assert client.post("/predict", json=body).status_code == 400
+
+
+# -----------------
+# Result cache
+# -----------------
+def test_cache_skips_out_of_range_keys(client):
+    main._CACHE.clear()
+    assert client.post("/predict", json=axes()).status_code == 200
+    assert len(main._CACHE) == 1
+    # finite, but the scaled features overflow an int32 key
+    for v in (1e30, -3e30):
+        body = axes(ax=[v] * main.WIN)
+        assert client.post("/predict", json=body).status_code == 200
+    assert len(main._CACHE) == 1
+
+
+# -----------------
+# /predict_mp
+# -----------------
+def test_predict_mp_ok(client):
+    r = client.post("/predict_mp", content=msgpack.packb(axes()))
+    assert r.status_code == 200
+    assert r.json() == client.post("/predict", json=axes()).json()
+
+
+@pytest.mark.parametrize("bad", [float("nan"), float("inf"), float("-inf")])
+def test_predict_mp_rejects_non_finite(client, bad):
+    # msgpack carries IEEE floats as-is, unlike JSON
+    body = axes()
+    body["az"] = body["az"][:10] + [bad] + body["az"][11:]
+    r = client.post("/predict_mp", content=msgpack.packb(body))
+    assert r.status_code == 422
+    (err,) = r.json()["detail"]
+    assert err["loc"] == ["body", "az", 10]
+
+
+def test_predict_mp_invalid_body(client):
+    assert client.post("/predict_mp", content=b"\xc1").status_code == 400
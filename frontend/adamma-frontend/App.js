@@ -107,7 +107,11 @@ export default function App() {
       const res = await fetch(predictUrl(), {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ samples })
+        body: JSON.stringify({
+          ax: samples.map(s => s.accel_x),
+          ay: samples.map(s => s.accel_y),
+          az: samples.map(s => s.accel_z),
+        })
       });
       if (!res.ok) {
         const txt = await res.text().catch(()=> "");
@@ -3,11 +3,11 @@ from pathlib import Path
 raw_file = Path("ml/data/raw/WISDM_ar_v1.1_raw.txt")
 clean_file = Path("ml/data/raw/WISDM_clean.txt")
 
-with raw_file.open("r") as infile, clean_file.open("w") as outfile:
-    for line in infile:
-        # Replace ",;" at the end with ";"
-        if line.strip().endswith(",;"):
-            line = line.replace(",;", ";")
-        outfile.write(line)
+# Replace ",;" at the end of each line with ";" in one pass over the whole buffer
+data = raw_file.read_bytes()
+data = data.replace(b",;\n", b";\n").replace(b",;\r\n", b";\r\n")
+if data.endswith(b",;"):  # last line without a newline
+    data = data[:-2] + b";"
+clean_file.write_bytes(data)
 
 print(f"Cleaned file written to {clean_file}")
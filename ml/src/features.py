@@ -1,18 +1,149 @@
 import numpy as np
 import pandas as pd
+from numba import njit
+
+N_FEATURES = 20  # 6 stats x 3 axes + magnitude mean/std
+
+# Fast math minus nnan/ninf so the non-finite guard below is not optimized away
+FASTMATH = {"reassoc", "contract", "arcp"}
 
 # -----------------
-# Windowing + features extraction
+# Numba kernels
 # -----------------
-def window_indices(n: int, win: int, step: int):
+@njit(cache=True)
+def _select(buf, lo, hi, k):
+    """
+    In-place quickselect on buf[lo:hi]: afterwards buf[k] holds the value of
+    that rank and everything after k is >= buf[k].
+    """
+    hi -= 1
+    while lo < hi:
+        pivot = buf[(lo + hi) // 2]
+        i, j = lo, hi
+        while i <= j:
+            while buf[i] < pivot:
+                i += 1
+            while buf[j] > pivot:
+                j -= 1
+            if i <= j:
+                buf[i], buf[j] = buf[j], buf[i]
+                i += 1
+                j -= 1
+        if k <= j:
+            hi = j
+        elif k >= i:
+            lo = i
+        else:
+            break
+    return buf[k]
+
+
+@njit(cache=True)
+def select_quantile(buf, lo, n, q):
     """
-    Generator for sliding window start/end indices.
-    n    = total number of samples
-    win  = window length (samples)
-    step = step size (samples)
+    q-quantile (0..1) of buf[:n] with np.percentile's default linear
+    interpolation. Reorders buf.
+
+    buf[:lo] must already be <= everything in buf[lo:n] (as left by a previous
+    call for a lower q), so ascending quantiles share one partitioning sweep.
+    Returns (value, lo for the next call).
     """
-    for start in range(0, n - win + 1, step):
-        yield start, start + win
+    pos = q * (n - 1)
+    k = int(np.floor(pos))
+    t = pos - k
+    lo = min(lo, k)
+    v_lo = _select(buf, lo, n, k)
+    if t == 0.0:
+        return v_lo, k + 1
+    # (k+1)-th smallest = min of the upper partition
+    v_hi = buf[k + 1]
+    for i in range(k + 2, n):
+        if buf[i] < v_hi:
+            v_hi = buf[i]
+    d = v_hi - v_lo
+    if t >= 0.5:
+        return v_hi - d * (1.0 - t), k + 1
+    return v_lo + d * t, k + 1
+
+
+@njit(cache=True, nogil=True, fastmath=FASTMATH)
+def _window_features(seg, buf, acc, out):
+    """
+    Write the 20 features of one window seg [win, 3] into out (float32).
+    buf is a [4, win] scratch: one row per axis plus one for magnitude;
+    acc is a float64 [20] scratch holding the statistics while they are built.
+    """
+    n = seg.shape[0]
+    # acc layout: slot 6k = sum, 6k+1 = squared deviations, 6k+2/6k+3 = min/max
+    # for axis k; slots 18/19 the same for magnitude.
+    for k in range(3):
+        o = 6 * k
+        acc[o] = 0.0
+        acc[o + 1] = 0.0
+        acc[o + 2] = seg[0, k]
+        acc[o + 3] = seg[0, k]
+    acc[18] = 0.0
+    acc[19] = 0.0
+
+    # one row-major sweep: per-axis sum/min/max and magnitude for all channels
+    for i in range(n):
+        m2 = 0.0
+        for k in range(3):
+            o = 6 * k
+            v = seg[i, k]
+            buf[k, i] = v
+            acc[o] += v
+            m2 += v * v
+            if v < acc[o + 2]:
+                acc[o + 2] = v
+            if v > acc[o + 3]:
+                acc[o + 3] = v
+        m = np.sqrt(m2)
+        buf[3, i] = m
+        acc[18] += m
+    for k in range(3):
+        acc[6 * k] /= n
+    acc[18] /= n
+
+    # second sweep: squared deviations for std
+    for i in range(n):
+        for k in range(3):
+            d = buf[k, i] - acc[6 * k]
+            acc[6 * k + 1] += d * d
+        d = buf[3, i] - acc[18]
+        acc[19] += d * d
+    for k in range(3):
+        acc[6 * k + 1] = np.sqrt(acc[6 * k + 1] / n)
+    acc[19] = np.sqrt(acc[19] / n)
+
+    for k in range(3):  # per-axis median/IQR
+        o = 6 * k
+        if np.isnan(acc[o]):  # NaN propagates through every stat -> all zeroed below
+            acc[o:o + 6] = np.nan
+            continue
+        row = buf[k]
+        q25, r = select_quantile(row, 0, n, 0.25)
+        q50, r = select_quantile(row, r, n, 0.5)
+        q75, r = select_quantile(row, r, n, 0.75)
+        acc[o + 4] = q50
+        acc[o + 5] = q75 - q25  # IQR
+
+    # narrow to out's dtype first, then nan/inf -> 0 (finite float64 stats
+    # beyond float32 range overflow to inf on the store)
+    for f in range(N_FEATURES):
+        out[f] = acc[f]
+        if not np.isfinite(out[f]):
+            out[f] = 0.0
+
+
+@njit(cache=True)
+def _feat_kernel(A, win, step, out):
+    """Fill out [n_windows, 20] with the features of each sliding window of A [n, 3]."""
+    buf = np.empty((4, win))
+    acc = np.empty(N_FEATURES)
+    for w in range(out.shape[0]):
+        i = w * step
+        _window_features(A[i:i + win], buf, acc, out[w])
 
 
 def extract_features(
@@ -24,7 +155,7 @@ def extract_features(
 ):
     """
     Extract windowed statistical features from accelerometer DataFrame.
-    Returns X (n_windows, n_features), y (labels).
+    Returns X (n_windows, n_features) float32, y (labels).
     
     Features per window:
     - For each axis (x,y,z): mean, std, min, max, median, IQR
@@ -33,63 +164,49 @@ def extract_features(
     """
     win = int(win_sec * fs)
     step = int(win * (1 - overlap))
-    X, y = [], []
 
     # Ensure numeric
-    A = frame[["accel_x", "accel_y", "accel_z"]].to_numpy(dtype=np.float64)
+    A = np.ascontiguousarray(frame[["accel_x", "accel_y", "accel_z"]].to_numpy(dtype=np.float64))
     L = frame[label_col].to_numpy()
 
-    for i, j in window_indices(len(frame), win, step):
-        seg = A[i:j]   # [win, 3]
-        labs = L[i:j]
-
-        # majority label in window
-        vals, cnts = np.unique(labs, return_counts=True)
-        majority = vals[np.argmax(cnts)]
+    n_windows = len(range(0, len(frame) - win + 1, step))
+    if n_windows == 0:
+        raise ValueError(f"Not enough samples ({len(frame)}) for a single window of {win}")
 
-        feats = []
-        for k in range(3):  # per-axis stats
-            a = seg[:, k]
-            feats += [
-                float(a.mean()),
-                float(a.std()),
-                float(a.min()),
-                float(a.max()),
-                float(np.median(a)),
-                float(np.percentile(a, 75) - np.percentile(a, 25)),  # IQR
-            ]
+    X = np.empty((n_windows, N_FEATURES), dtype=np.float32)
+    _feat_kernel(A, win, step, X)
 
-        # magnitude stats
-        mag = np.linalg.norm(seg, axis=1)
-        feats += [float(mag.mean()), float(mag.std())]
+    # majority label in each window (ties -> first label in sorted order, as np.unique)
+    vals, codes = np.unique(L, return_inverse=True)
+    counts = np.zeros((len(L) + 1, len(vals)), dtype=np.int64)
+    counts[np.arange(1, len(L) + 1), codes] = 1
+    counts = counts.cumsum(axis=0)
+    starts = np.arange(n_windows) * step
+    win_counts = counts[starts + win] - counts[starts]
+    y = vals[np.argmax(win_counts, axis=1)]
 
-        feats = np.nan_to_num(np.array(feats), nan=0.0, posinf=0.0, neginf=0.0)
-        X.append(feats)
-        y.append(majority)
+    return X, y
 
-    return np.vstack(X), np.array(y)
 
-
-def extract_single_window(seg: np.ndarray) -> np.ndarray:
+def extract_single_window(
+    seg: np.ndarray,
+    out: np.ndarray = None,
+    buf: np.ndarray = None,
+    acc: np.ndarray = None,
+) -> np.ndarray:
     """
     Compute features for a single window [win, 3].
     Used for inference (backend).
-    Returns: 1D feature vector of length 20.
+    Returns: 1D float32 feature vector of length 20, written into out if given.
+    buf ([4, win]) and acc ([20] float64) are optional scratch arrays
+    (allocated per call otherwise).
     """
-    feats = []
-    for k in range(3):
-        a = seg[:, k]
-        feats += [
-            float(a.mean()),
-            float(a.std()),
-            float(a.min()),
-            float(a.max()),
-            float(np.median(a)),
-            float(np.percentile(a, 75) - np.percentile(a, 25)),
-        ]
-
-    mag = np.linalg.norm(seg, axis=1)
-    feats += [float(mag.mean()), float(mag.std())]
-
-    feats = np.nan_to_num(np.array(feats), nan=0.0, posinf=0.0, neginf=0.0)
-    return feats
+    seg = np.ascontiguousarray(seg, dtype=np.float64)
+    if out is None:
+        out = np.empty(N_FEATURES, dtype=np.float32)
+    if buf is None:
+        buf = np.empty((4, seg.shape[0]))
+    if acc is None:
+        acc = np.empty(N_FEATURES)
+    _window_features(seg, buf, acc, out)
+    return out
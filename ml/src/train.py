@@ -1,11 +1,13 @@
 from pathlib import Path
+import argparse
+import hashlib
 import time
 import numpy as np
 import pandas as pd
 
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.ensemble import RandomForestClassifier
+from sklearn.ensemble import RandomForestClassifier, HistGradientBoostingClassifier
 from sklearn.linear_model import LogisticRegression
 from sklearn.svm import SVC
 from sklearn.neural_network import MLPClassifier
@@ -13,10 +15,17 @@ from sklearn.metrics import (
     accuracy_score, f1_score, classification_report, confusion_matrix
 )
 import joblib
-import matplotlib.pyplot as plt
-import seaborn as sns
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType
 
-from features import extract_features
+from features import extract_features, N_FEATURES
+
+# -----------------
+# CLI
+# -----------------
+parser = argparse.ArgumentParser(description="Train and compare MET classifiers on WISDM.")
+parser.add_argument("--plot", action="store_true", help="save confusion matrix figures to docs/figures")
+args = parser.parse_args()
 
 # -----------------
 # Config
@@ -47,17 +56,18 @@ MODELS_DIR.mkdir(parents=True, exist_ok=True)
 # Load + quick clean
 # -----------------
 # WISDM rows: user,activity,timestamp,accel_x,accel_y,accel_z;
+# ';' is read as a comment, so the C parser never sees the terminator and
+# accel_z parses straight to float (no string clean-up pass).
 df = pd.read_csv(
     RAW,
     header=None,
     names=["user", "activity", "timestamp", "accel_x", "accel_y", "accel_z"],
-    sep=","
+    sep=",",
+    engine="c",
+    comment=";",
+    dtype={"accel_x": np.float64, "accel_y": np.float64, "accel_z": np.float64},
 )
 
-# Remove trailing semicolons in accel_z if present
-if df["accel_z"].dtype == object:
-    df["accel_z"] = df["accel_z"].astype(str).str.replace(";", "", regex=False).astype(float)
-
 # -----------------
 # Map activities → MET classes
 # -----------------
@@ -97,6 +107,10 @@ models = {
     "RandomForest": RandomForestClassifier(
         n_estimators=300, random_state=RNG_SEED, n_jobs=-1
     ),
+    # Features binned to <=63 uint8 buckets once; trees split on bin indices
+    "HistGradientBoosting": HistGradientBoostingClassifier(
+        max_iter=300, max_bins=63, random_state=RNG_SEED
+    ),
     "LogisticRegression": LogisticRegression(
         max_iter=2000, multi_class="multinomial", solver="lbfgs", class_weight="balanced", random_state=RNG_SEED
     ),
@@ -112,8 +126,30 @@ models = {
 }
 
 # -----------------
-# Train + evaluate helper
-# -----------------
+# Train + evaluate helpers
+# -----------------
+def plot_confusion_matrix(cm, labels_text, name):
+    import matplotlib.pyplot as plt  # deferred: only needed with --plot
+
+    n = len(labels_text)
+    fig, ax = plt.subplots(figsize=(6,5))
+    im = ax.imshow(cm, cmap="Blues", vmin=0.0, vmax=1.0)
+    fig.colorbar(im, ax=ax)
+    for i in range(n):
+        for j in range(n):
+            ax.text(j, i, f"{cm[i, j]:.2f}", ha="center", va="center",
+                    color="white" if cm[i, j] > 0.5 else "black")
+    ax.set_xticks(np.arange(n), labels=labels_text)
+    ax.set_yticks(np.arange(n), labels=labels_text)
+    ax.set_title(f"Confusion Matrix (Normalized) — {name}")
+    ax.set_xlabel("Predicted Label")
+    ax.set_ylabel("True Label")
+    fig.tight_layout()
+    fig_path = FIG_DIR / f"confusion_matrix_{name}.png"
+    fig.savefig(fig_path, dpi=150)
+    plt.close(fig)
+    return fig_path
+
 def evaluate_model(name, model, Xtr, ytr, Xte, yte, labels_text):
     t0 = time.time()
     model.fit(Xtr, ytr)
@@ -126,17 +162,7 @@ def evaluate_model(name, model, Xtr, ytr, Xte, yte, labels_text):
     # Confusion matrix (row-normalized)
     cm = confusion_matrix(yte, ypred, labels=np.arange(len(labels_text)), normalize="true")
 
-    # Save confusion matrix figure
-    plt.figure(figsize=(6,5))
-    sns.heatmap(cm, annot=True, fmt=".2f", cmap="Blues",
-                xticklabels=labels_text, yticklabels=labels_text)
-    plt.title(f"Confusion Matrix (Normalized) — {name}")
-    plt.xlabel("Predicted Label")
-    plt.ylabel("True Label")
-    plt.tight_layout()
-    fig_path = FIG_DIR / f"confusion_matrix_{name}.png"
-    plt.savefig(fig_path, dpi=150)
-    plt.close()
+    fig_path = plot_confusion_matrix(cm, labels_text, name) if args.plot else None
 
     # Classification report to file
     clsrep_txt = classification_report(yte, ypred, target_names=labels_text)
@@ -146,7 +172,8 @@ def evaluate_model(name, model, Xtr, ytr, Xte, yte, labels_text):
     art_path = MODELS_DIR / f"{name}.pkl"
     joblib.dump(
         {"model": model, "scaler": scaler, "label_encoder": le, "fs": FS, "win_sec": WIN_SEC, "overlap": OVERLAP},
-        art_path
+        art_path,
+        compress=0,  # kept uncompressed: faster backend startup beats a smaller file
     )
 
     return {
@@ -154,10 +181,23 @@ def evaluate_model(name, model, Xtr, ytr, Xte, yte, labels_text):
         "Accuracy": acc,
         "F1_macro": f1m,
         "TrainTime_sec": train_time,
-        "confmat_path": str(fig_path),
+        "confmat_path": str(fig_path) if fig_path else None,
         "artifact_path": str(art_path),
     }
 
+# -----------------
+# ONNX export (backend serves this when present)
+# -----------------
+def export_onnx(model, path):
+    onx = convert_sklearn(
+        model,
+        initial_types=[("X", FloatTensorType([None, N_FEATURES]))],
+        options={id(model): {"zipmap": False}},  # plain [n, classes] proba tensor
+    )
+    data = onx.SerializeToString()
+    path.write_bytes(data)
+    return hashlib.sha256(data).hexdigest()
+
 # -----------------
 # Run comparisons
 # -----------------
@@ -168,7 +208,8 @@ for name, mdl in models.items():
     results.append(res)
     print(f"{name} — Acc: {res['Accuracy']:.3f} | F1(macro): {res['F1_macro']:.3f} | Train: {res['TrainTime_sec']:.2f}s")
     print(f"Saved: {res['artifact_path']}")
-    print(f"Confusion matrix → {res['confmat_path']}")
+    if res["confmat_path"]:
+        print(f"Confusion matrix → {res['confmat_path']}")
     print(f"Classification report → {REPORTS_DIR / f'classification_report_{name}.txt'}")
 
 # -----------------
@@ -196,7 +237,13 @@ best_artifact = best_row["artifact_path"]
 # Load best artifact 
 best_payload = joblib.load(best_artifact)
 
+# ONNX export first: model.pkl records its hash, so the backend only serves an
+# export that belongs to the pickled model (a failed export leaves both stale)
+ONNX_ART = SRC_DIR / "model.onnx"
+best_payload["onnx_sha256"] = export_onnx(best_payload["model"], ONNX_ART)
+
 ART = SRC_DIR / "model.pkl"
-joblib.dump(best_payload, ART)
+joblib.dump(best_payload, ART, compress=0)
 print(f"\nBest model: {best_name} (F1_macro={best_row['F1_macro']:.3f})")
+print(f"Saved ONNX export of best model to: {ONNX_ART}")
 print(f"Saved canonical artifact for backend to: {ART}")
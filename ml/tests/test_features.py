@@ -0,0 +1,122 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+from features import N_FEATURES, extract_features, extract_single_window
+
+
+# -----------------
+# NumPy reference (the implementation the Numba kernels replaced)
+# -----------------
+def ref_single_window(seg):
+    feats = []
+    for k in range(3):
+        a = seg[:, k]
+        feats += [
+            a.mean(), a.std(), a.min(), a.max(), np.median(a),
+            np.percentile(a, 75) - np.percentile(a, 25),
+        ]
+    mag = np.linalg.norm(seg, axis=1)
+    feats += [mag.mean(), mag.std()]
+    return np.nan_to_num(np.array(feats), nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def ref_features(frame, fs, win_sec, overlap):
+    win = int(win_sec * fs)
+    step = int(win * (1 - overlap))
+    A = frame[["accel_x", "accel_y", "accel_z"]].to_numpy(dtype=np.float64)
+    L = frame["met_class"].to_numpy()
+    X, y = [], []
+    for i in range(0, len(frame) - win + 1, step):
+        vals, cnts = np.unique(L[i:i + win], return_counts=True)
+        X.append(ref_single_window(A[i:i + win]))
+        y.append(vals[np.argmax(cnts)])
+    return np.vstack(X), np.array(y)
+
+
+def assert_close(got, want):
+    assert got.dtype == np.float32
+    np.testing.assert_allclose(got, want, rtol=1e-5, atol=1e-5)
+
+
+# -----------------
+# extract_single_window
+# -----------------
+@pytest.mark.parametrize("n", [1, 2, 3, 5, 7, 101, 150])
+def test_single_window_random(n):
+    rng = np.random.default_rng(n)
+    for _ in range(20):
+        seg = rng.normal(0.0, 3.0, size=(n, 3))
+        assert_close(extract_single_window(seg), ref_single_window(seg))
+
+
+@pytest.mark.parametrize("n", [1, 2, 4, 9, 150])
+def test_single_window_ties(n):
+    rng = np.random.default_rng(100 + n)
+    for _ in range(20):
+        # few distinct values -> many equal elements around every quantile
+        seg = rng.integers(-2, 3, size=(n, 3)).astype(np.float64)
+        assert_close(extract_single_window(seg), ref_single_window(seg))
+    const = np.full((n, 3), 9.81)
+    assert_close(extract_single_window(const), ref_single_window(const))
+
+
+def test_single_window_reuses_scratch():
+    rng = np.random.default_rng(0)
+    out = np.empty(N_FEATURES, dtype=np.float32)
+    buf = np.empty((4, 50))
+    acc = np.empty(N_FEATURES)
+    for _ in range(5):
+        seg = rng.normal(size=(50, 3))
+        got = extract_single_window(seg, out=out, buf=buf, acc=acc)
+        assert got is out
+        assert_close(got, ref_single_window(seg))
+
+
+def test_single_window_non_finite():
+    seg = np.random.default_rng(1).normal(size=(10, 3))
+    seg[3, 1] = np.nan
+    seg[5, 2] = np.inf
+    with np.errstate(invalid="ignore"):
+        want = ref_single_window(seg)
+    assert_close(extract_single_window(seg), want)
+
+
+def test_single_window_float32_overflow():
+    # finite in float64 but beyond FLT_MAX: must come out as 0, never inf
+    seg = np.random.default_rng(2).normal(size=(10, 3))
+    seg[:, 0] = 1e39
+    got = extract_single_window(seg)
+    assert np.isfinite(got).all()
+    assert (got[[0, 2, 3, 4]] == 0.0).all()
+    np.testing.assert_allclose(got[6:18], ref_single_window(seg)[6:18], rtol=1e-5, atol=1e-5)
+
+
+# -----------------
+# extract_features
+# -----------------
+@pytest.mark.parametrize("fs,win_sec,overlap", [(20, 5.0, 0.5), (7, 1.0, 0.5), (2, 1.0, 0.0), (1, 1.0, 0.0)])
+def test_extract_features_matches_reference(fs, win_sec, overlap):
+    rng = np.random.default_rng(fs)
+    n = 403
+    frame = pd.DataFrame({
+        "accel_x": rng.normal(size=n),
+        "accel_y": rng.normal(size=n),
+        "accel_z": rng.integers(-1, 2, size=n).astype(np.float64),  # ties
+        # two labels in runs of 3 -> tied windows for even window lengths
+        "met_class": np.repeat(np.array(["moderate", "light"]), 3)[np.arange(n) % 6],
+    })
+    X, y = extract_features(frame, fs, win_sec, overlap)
+    X_ref, y_ref = ref_features(frame, fs, win_sec, overlap)
+    assert_close(X, X_ref)
+    np.testing.assert_array_equal(y, y_ref)
+
+
+def test_extract_features_too_short():
+    frame = pd.DataFrame({c: np.zeros(5) for c in ["accel_x", "accel_y", "accel_z", "met_class"]})
+    with pytest.raises(ValueError):
+        extract_features(frame, fs=20, win_sec=5.0)